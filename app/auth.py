@@ -1,6 +1,10 @@
 """Simple password authentication for the app."""
 
+import asyncio
+import hashlib
 import secrets
+import time
+from typing import Final
 from fastapi import Request, HTTPException, status
 from fastapi.responses import HTMLResponse
 
@@ -8,9 +12,18 @@ from app.config import get_settings
 
 settings = get_settings()
 
+# Resolved once at import so request handlers read a plain module constant
+AUTH_ENABLED: Final[bool] = settings.auth_enabled
+
+SESSION_MAX_AGE = 86400 * 7  # 7 days
+SESSION_SWEEP_INTERVAL = 60  # seconds
+MAX_PASSWORD_LENGTH = 256
+
 # Simple session storage (in-memory, resets on restart)
+# Maps a digest of each session token to its expiry time, so live tokens are
+# never held in plaintext and expired sessions can be swept.
 # For production, consider using signed cookies or a proper session store
-authenticated_sessions: set[str] = set()
+authenticated_sessions: dict[bytes, float] = {}
 
 
 def generate_session_token() -> str:
@@ -18,10 +31,43 @@ def generate_session_token() -> str:
     return secrets.token_urlsafe(32)
 
 
+def _session_key(token: str) -> bytes:
+    """Hash a session token into its storage key."""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def add_session(token: str) -> None:
+    """Register a session token as authenticated."""
+    authenticated_sessions[_session_key(token)] = time.time() + SESSION_MAX_AGE
+
+
+def remove_session(token: str) -> None:
+    """Forget a session token."""
+    authenticated_sessions.pop(_session_key(token), None)
+
+
+def purge_expired_sessions() -> None:
+    """Drop every expired session from the store."""
+    now = time.time()
+    expired = [key for key, expires in authenticated_sessions.items() if expires <= now]
+    for key in expired:
+        del authenticated_sessions[key]
+
+
+async def sweep_sessions_forever() -> None:
+    """Periodically purge expired sessions (run as a background task)."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        purge_expired_sessions()
+
+
 def verify_password(password: str) -> bool:
     """Check if the provided password matches."""
-    if not settings.auth_enabled:
+    if not AUTH_ENABLED:
         return True
+    # Bounding the attacker's input leaks nothing about the secret's length
+    if len(password) > MAX_PASSWORD_LENGTH:
+        return False
     return secrets.compare_digest(password, settings.app_password)
 
 
@@ -32,15 +78,24 @@ def get_session_token(request: Request) -> str | None:
 
 def is_authenticated(request: Request) -> bool:
     """Check if the request is authenticated."""
-    if not settings.auth_enabled:
+    if not AUTH_ENABLED:
         return True
     token = get_session_token(request)
-    return token is not None and token in authenticated_sessions
+    if token is None:
+        return False
+    key = _session_key(token)
+    expires = authenticated_sessions.get(key)
+    if expires is None:
+        return False
+    if expires <= time.time():
+        authenticated_sessions.pop(key, None)
+        return False
+    return True
 
 
 def require_auth(request: Request) -> None:
     """Dependency that requires authentication."""
-    if not settings.auth_enabled:
+    if not AUTH_ENABLED:
         return
     if not is_authenticated(request):
         raise HTTPException(
@@ -86,9 +141,23 @@ LOGIN_PAGE_HTML = """
 """
 
 
+# Pre-rendered login page bodies, so GET /login and failed logins skip the
+# template formatting and encoding entirely.
+_EMPTY_BODY: bytes = LOGIN_PAGE_HTML.format(error="").encode("utf-8")
+_ERROR_BODIES: dict[str, bytes] = {}
+
+
+def _render_login_page(error: str) -> bytes:
+    """Render the login page with an error message."""
+    error_html = f'<div class="bg-red-100 text-red-800 p-3 rounded mb-4 text-sm">{error}</div>'
+    return LOGIN_PAGE_HTML.format(error=error_html).encode("utf-8")
+
+
 def get_login_page(error: str = "") -> HTMLResponse:
     """Return the login page HTML."""
-    error_html = ""
-    if error:
-        error_html = f'<div class="bg-red-100 text-red-800 p-3 rounded mb-4 text-sm">{error}</div>'
-    return HTMLResponse(LOGIN_PAGE_HTML.format(error=error_html))
+    if not error:
+        return HTMLResponse(content=_EMPTY_BODY, media_type="text/html")
+    body = _ERROR_BODIES.get(error)
+    if body is None:
+        body = _ERROR_BODIES[error] = _render_login_page(error)
+    return HTMLResponse(content=body, media_type="text/html")
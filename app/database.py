@@ -1,7 +1,12 @@
-from sqlalchemy import create_engine, text, inspect
+import logging
+
+from sqlalchemy import Connection, create_engine, event, text, inspect
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 from app.config import get_settings
+from app.normalize import normalize_vietnamese
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
@@ -11,6 +16,20 @@ if settings.database_url.startswith("sqlite"):
     connect_args["check_same_thread"] = False
 
 engine = create_engine(settings.database_url, connect_args=connect_args)
+
+if settings.database_url.startswith("sqlite"):
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL, fewer fsyncs, mmap I/O and a bigger page cache for SQLite."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+        cursor.execute("PRAGMA cache_size=-65536")  # 64MB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -26,9 +45,16 @@ def get_db():
         db.close()
 
 
-def run_migrations():
+def init_db():
+    """Create missing tables and apply migrations in a single transaction."""
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        run_migrations(conn)
+
+
+def run_migrations(conn: Connection):
     """Run simple schema migrations for new columns."""
-    inspector = inspect(engine)
+    inspector = inspect(conn)
 
     # Check if cards table exists
     if "cards" not in inspector.get_table_names():
@@ -39,6 +65,63 @@ def run_migrations():
 
     # Add mastered column if it doesn't exist
     if "mastered" not in columns:
-        with engine.connect() as conn:
-            conn.execute(text("ALTER TABLE cards ADD COLUMN mastered BOOLEAN DEFAULT 0"))
-            conn.commit()
+        conn.execute(text("ALTER TABLE cards ADD COLUMN mastered BOOLEAN DEFAULT 0"))
+
+    # Add normalized answer keys and backfill them for existing cards
+    for key_column in ("vietnamese_key", "english_key"):
+        if key_column not in columns:
+            conn.execute(text(f"ALTER TABLE cards ADD COLUMN {key_column} VARCHAR"))
+    missing_keys = conn.execute(text(
+        "SELECT id, vietnamese, english FROM cards "
+        "WHERE vietnamese_key IS NULL OR english_key IS NULL"
+    )).all()
+    if missing_keys:
+        conn.execute(
+            text("UPDATE cards SET vietnamese_key = :viet, english_key = :eng WHERE id = :id"),
+            [
+                {
+                    "id": card_id,
+                    "viet": normalize_vietnamese(vietnamese),
+                    "eng": normalize_vietnamese(english),
+                }
+                for card_id, vietnamese, english in missing_keys
+            ],
+        )
+
+    # Add indexes used by the filtered card queries
+    indexes = {index["name"] for index in inspector.get_indexes("cards")}
+    lookup_indexes = {
+        "ix_cards_category": "CREATE INDEX IF NOT EXISTS ix_cards_category ON cards (category)",
+        "ix_cards_category_id": "CREATE INDEX IF NOT EXISTS ix_cards_category_id ON cards (category, id)",
+    }
+    for name, ddl in lookup_indexes.items():
+        if name not in indexes:
+            conn.execute(text(ddl))
+
+    # Answer keys are only read after a primary key lookup, never searched
+    for name in ("ix_cards_vietnamese_key", "ix_cards_english_key"):
+        if name in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+
+    # Enforce unique (vietnamese, english) pairs, merging any old duplicates
+    # into the oldest copy so their review history is kept
+    if "uq_cards_vietnamese_english" not in indexes:
+        same_pair = "c2.vietnamese = cards.vietnamese AND c2.english = cards.english"
+        conn.execute(text(f"""
+            UPDATE cards SET
+                success_count = (SELECT SUM(c2.success_count) FROM cards c2 WHERE {same_pair}),
+                fail_count = (SELECT SUM(c2.fail_count) FROM cards c2 WHERE {same_pair}),
+                last_reviewed = (SELECT MAX(c2.last_reviewed) FROM cards c2 WHERE {same_pair}),
+                mastered = EXISTS (SELECT 1 FROM cards c2 WHERE {same_pair} AND c2.mastered)
+            WHERE id IN (
+                SELECT MIN(id) FROM cards GROUP BY vietnamese, english HAVING COUNT(*) > 1
+            )
+        """))
+        merged = conn.execute(text(
+            "DELETE FROM cards WHERE id NOT IN (SELECT MIN(id) FROM cards GROUP BY vietnamese, english)"
+        )).rowcount
+        if merged:
+            logger.warning(f"Merged {merged} duplicate cards")
+        conn.execute(text(
+            "CREATE UNIQUE INDEX uq_cards_vietnamese_english ON cards (vietnamese, english)"
+        ))
@@ -1,19 +1,29 @@
+import asyncio
+import difflib
+import hashlib
 import logging
-import unicodedata
-from datetime import datetime
+import os
+import random
+import time
+from contextlib import asynccontextmanager, nullcontext
 from enum import Enum
-from typing import Annotated
+from functools import lru_cache
+from typing import Annotated, Final
 
+import orjson
 from fastapi import FastAPI, Depends, HTTPException, Query, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, ORJSONResponse, RedirectResponse, Response
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only
 
 from app.config import get_settings
-from app.database import engine, get_db, Base, run_migrations
+from app.database import get_db, init_db
 from app.models import Card
+from app.normalize import normalize_vietnamese
 from app.schemas import (
     CardCreate,
     CardResponse,
@@ -29,14 +39,32 @@ from app.schemas import (
     TopicLoadResponse,
     ResetMasteryRequest,
 )
-from app.vocab_loader import get_available_topics, load_topic_into_db, sync_all_topics, VOCAB_DIR
+from app.stats_buffer import (
+    record_result,
+    flush_pending_stats,
+    discard_pending_stats,
+    flush_stats_forever,
+    stats_write_lock,
+)
+from app.vocab_loader import (
+    get_topic_listing,
+    load_topic_into_db,
+    reload_topic_index,
+    sync_all_topics,
+    VOCAB_DIR,
+)
 from app.auth import (
+    AUTH_ENABLED,
     require_auth,
     verify_password,
     generate_session_token,
-    authenticated_sessions,
+    add_session,
+    remove_session,
     is_authenticated,
     get_login_page,
+    sweep_sessions_forever,
+    SESSION_MAX_AGE,
+    MAX_PASSWORD_LENGTH,
 )
 
 # Configure logging
@@ -48,12 +76,31 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-Base.metadata.create_all(bind=engine)
-run_migrations()
+# Derived settings resolved once at import for the request path
+COOKIE_SECURE: Final[bool] = not settings.debug  # Secure cookies in production
+CORS_ORIGINS: Final[list[str]] = settings.cors_origins_list
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Prepare the database and vocab, then run background maintenance tasks."""
+    await run_in_threadpool(init_db)
+    await run_in_threadpool(reload_topic_index)
+    session_sweeper = asyncio.create_task(sweep_sessions_forever())
+    stats_flusher = asyncio.create_task(flush_stats_forever(on_flush=invalidate_stats_cache))
+    try:
+        yield
+    finally:
+        session_sweeper.cancel()
+        stats_flusher.cancel()
+        await asyncio.gather(stats_flusher, return_exceptions=True)
+
 
 app = FastAPI(
     title="MyCon Learn",
     description="Vietnamese flashcard learning app",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.debug else None,  # Disable docs in production
     redoc_url="/redoc" if settings.debug else None,
 )
@@ -61,7 +108,7 @@ app = FastAPI(
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.cors_origins_list,
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -69,48 +116,159 @@ app.add_middleware(
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+INDEX_HTML = "static/index.html"
+
 
 class QuizMode(str, Enum):
     ENG_TO_VIET = "eng_to_viet"
     VIET_TO_ENG = "viet_to_eng"
 
 
-def normalize_vietnamese(text: str) -> str:
-    """Normalize Vietnamese text for comparison."""
-    text = text.strip().lower()
-    text = unicodedata.normalize("NFC", text)
-    return text
+# Per-category (count, expires_at) used to sample a random card by offset
+# along the (category, id) index instead of ORDER BY RANDOM().
+DECK_SIZE_TTL = 30.0  # seconds
+_deck_size_cache: dict[str | None, tuple[int, float]] = {}
 
 
-def generate_diff(expected: str, actual: str) -> str:
-    """Generate a simple diff showing character-level differences."""
-    diff_parts = []
-    max_len = max(len(expected), len(actual))
+def invalidate_deck_cache() -> None:
+    """Forget cached deck sizes after cards are added or removed."""
+    _deck_size_cache.clear()
+
+
+def get_deck_size(db: Session, category: str | None, refresh: bool = False) -> int:
+    """Return the number of cards in the deck, cached for DECK_SIZE_TTL."""
+    cached = _deck_size_cache.get(category)
+    if cached and not refresh and cached[1] > time.monotonic():
+        return cached[0]
+
+    query = db.query(func.count(Card.id))
+    if category:
+        query = query.filter(Card.category == category)
+    count = query.scalar()
+
+    _deck_size_cache[category] = (count, time.monotonic() + DECK_SIZE_TTL)
+    return count
+
+
+def sample_card(db: Session, category: str | None, refresh: bool = False) -> Card | None:
+    """Pick a card uniformly at random by skipping a random number of rows."""
+    count = get_deck_size(db, category, refresh)
+    if not count:
+        return None
+
+    query = db.query(Card).options(
+        load_only(Card.id, Card.english, Card.vietnamese, Card.category)
+    )
+    if category:
+        query = query.filter(Card.category == category)
+
+    return query.order_by(Card.id).offset(random.randrange(count)).first()
+
+
+def get_card_answers(db: Session, card_id: int) -> Card | None:
+    """Fetch a card with only the columns needed to check or hint an answer."""
+    return db.execute(
+        select(Card)
+        .options(load_only(
+            Card.id, Card.vietnamese, Card.english, Card.vietnamese_key, Card.english_key
+        ))
+        .where(Card.id == card_id)
+    ).scalar_one_or_none()
+
+
+# Card columns making up a CardResponse, in field order
+CARD_RESPONSE_COLUMNS = tuple(getattr(Card, name) for name in CardResponse.model_fields)
+
+
+# Memoized /api/stats payload, dropped whenever card counts or results change.
+_stats_cache: dict | None = None
+
+
+def invalidate_stats_cache() -> None:
+    """Forget the cached stats after a write to the cards table."""
+    global _stats_cache
+    _stats_cache = None
+
+
+# (expires_at, categories, etag) for /api/categories
+CATEGORIES_TTL = 30.0  # seconds
+_categories_cache: tuple[float, list[str], str] | None = None
+
+
+def invalidate_categories_cache() -> None:
+    """Forget the cached category list after cards are added or removed."""
+    global _categories_cache
+    _categories_cache = None
+
+
+def invalidate_card_caches() -> None:
+    """Forget everything derived from the set of cards."""
+    invalidate_deck_cache()
+    invalidate_categories_cache()
+    invalidate_stats_cache()
+
+
+def make_etag(payload) -> str:
+    """Build a strong ETag from a JSON-serializable payload."""
+    return f'"{hashlib.blake2b(orjson.dumps(payload), digest_size=8).hexdigest()}"'
+
 
-    for i in range(max_len):
-        exp_char = expected[i] if i < len(expected) else ""
-        act_char = actual[i] if i < len(actual) else ""
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the client already holds the representation for etag.
 
-        if exp_char != act_char:
-            if exp_char and act_char:
-                diff_parts.append(f"'{act_char}'->'{exp_char}'")
-            elif exp_char:
-                diff_parts.append(f"missing '{exp_char}'")
-            else:
-                diff_parts.append(f"extra '{act_char}'")
+    Uses the weak comparison RFC 9110 specifies for If-None-Match, and treats
+    "*" as matching any current representation.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    """Build an empty 304 response for a matching conditional GET."""
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def generate_diff(expected: str, actual: str) -> str | None:
+    """Generate a diff describing the edits that turn actual into expected."""
+    if expected == actual:
+        return None
+
+    matcher = difflib.SequenceMatcher(None, actual, expected, autojunk=False)
+    diff_parts = []
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "replace":
+            diff_parts.append(f"'{actual[i1:i2]}'->'{expected[j1:j2]}'")
+        elif tag == "delete":
+            diff_parts.append(f"extra '{actual[i1:i2]}'")
+        elif tag == "insert":
+            diff_parts.append(f"missing '{expected[j1:j2]}'")
 
     return ", ".join(diff_parts) if diff_parts else None
 
 
+@lru_cache(maxsize=4096)
+def hints_for(answer: str) -> tuple[str, str]:
+    """Build the word-shape and first-letter hints for an answer."""
+    words = answer.split()
+    shapes = " ".join(f"{'_' * len(word)}({len(word)})" for word in words)
+    first_letters = " ".join(word[0] + "_" * (len(word) - 1) for word in words)
+    return shapes, first_letters
+
+
 def generate_hint(card: Card, mode: QuizMode, hint_level: int) -> str:
     """Generate hints based on hint level."""
     answer = card.vietnamese if mode == QuizMode.ENG_TO_VIET else card.english
-    words = answer.split()
 
     if hint_level == 1:
-        return " ".join(f"{'_' * len(word)}({len(word)})" for word in words)
+        return hints_for(answer)[0]
     elif hint_level == 2:
-        return " ".join(word[0] + "_" * (len(word) - 1) for word in words)
+        return hints_for(answer)[1]
     else:
         return answer
 
@@ -129,7 +287,7 @@ async def health_check():
 @app.get("/login")
 async def login_page(request: Request):
     """Show login page."""
-    if not settings.auth_enabled:
+    if not AUTH_ENABLED:
         return RedirectResponse(url="/", status_code=302)
     if is_authenticated(request):
         return RedirectResponse(url="/", status_code=302)
@@ -137,23 +295,26 @@ async def login_page(request: Request):
 
 
 @app.post("/login")
-async def login(request: Request, password: str = Form(...)):
+async def login(
+    request: Request,
+    password: Annotated[str, Form(max_length=MAX_PASSWORD_LENGTH)],
+):
     """Process login."""
-    if not settings.auth_enabled:
+    if not AUTH_ENABLED:
         return RedirectResponse(url="/", status_code=302)
 
     if verify_password(password):
         token = generate_session_token()
-        authenticated_sessions.add(token)
+        add_session(token)
         logger.info("User logged in successfully")
         response = RedirectResponse(url="/", status_code=302)
         response.set_cookie(
             key="session_token",
             value=token,
             httponly=True,
-            secure=not settings.debug,  # Secure in production
+            secure=COOKIE_SECURE,
             samesite="lax",
-            max_age=86400 * 7,  # 7 days
+            max_age=SESSION_MAX_AGE,
         )
         return response
     else:
@@ -165,8 +326,8 @@ async def login(request: Request, password: str = Form(...)):
 async def logout(request: Request):
     """Log out and clear session."""
     token = request.cookies.get("session_token")
-    if token and token in authenticated_sessions:
-        authenticated_sessions.discard(token)
+    if token:
+        remove_session(token)
     response = RedirectResponse(url="/login", status_code=302)
     response.delete_cookie("session_token")
     return response
@@ -180,9 +341,13 @@ async def logout(request: Request):
 @app.get("/")
 async def root(request: Request):
     """Serve the main app (requires auth if enabled)."""
-    if settings.auth_enabled and not is_authenticated(request):
+    if AUTH_ENABLED and not is_authenticated(request):
         return RedirectResponse(url="/login", status_code=302)
-    return FileResponse("static/index.html")
+    # Passing the stat result makes FileResponse set its ETag up front
+    index = FileResponse(INDEX_HTML, stat_result=os.stat(INDEX_HTML))
+    if etag_matches(request, index.headers["etag"]):
+        return not_modified(index.headers["etag"])
+    return index
 
 
 @app.get("/api/card/random", response_model=CardQuiz)
@@ -194,12 +359,8 @@ async def get_random_card(
     _: None = Depends(require_auth),
 ):
     """Get a random card for quiz."""
-    query = db.query(Card)
-
-    if category:
-        query = query.filter(Card.category == category)
-
-    card = query.order_by(func.random()).first()
+    # The cached size may be stale if cards changed outside the API; retry fresh
+    card = sample_card(db, category) or sample_card(db, category, refresh=True)
 
     if not card:
         raise HTTPException(status_code=404, detail="No cards available")
@@ -217,28 +378,20 @@ async def check_answer(
     _: None = Depends(require_auth),
 ):
     """Check if the user's answer is correct."""
-    card = db.query(Card).filter(Card.id == check_request.card_id).first()
+    card = get_card_answers(db, check_request.card_id)
 
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
 
+    # Card keys are normalized once when the card is stored
     user_normalized = normalize_vietnamese(check_request.user_input)
-    viet_normalized = normalize_vietnamese(card.vietnamese)
-    eng_normalized = normalize_vietnamese(card.english)
-
-    correct_viet = user_normalized == viet_normalized
-    correct_eng = user_normalized == eng_normalized
+    correct_viet = user_normalized == card.vietnamese_key
+    correct_eng = user_normalized == card.english_key
     correct = correct_viet or correct_eng
 
     if check_request.record_result or correct:
-        card.last_reviewed = datetime.utcnow()
-        if correct:
-            card.success_count += 1
-            if check_request.mark_mastered:
-                card.mastered = True
-        else:
-            card.fail_count += 1
-        db.commit()
+        record_result(card.id, correct, mastered=correct and check_request.mark_mastered)
+        invalidate_stats_cache()
 
     expected = None
     diff = None
@@ -261,14 +414,13 @@ async def give_up(
     _: None = Depends(require_auth),
 ):
     """Give up on a card and reveal the answer."""
-    card = db.query(Card).filter(Card.id == give_up_request.card_id).first()
+    card = get_card_answers(db, give_up_request.card_id)
 
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
 
-    card.last_reviewed = datetime.utcnow()
-    card.fail_count += 1
-    db.commit()
+    record_result(card.id, correct=False)
+    invalidate_stats_cache()
 
     return GiveUpResponse(
         answer=card.vietnamese,
@@ -286,7 +438,7 @@ async def get_hint(
     _: None = Depends(require_auth),
 ):
     """Get a hint for the current card."""
-    card = db.query(Card).filter(Card.id == hint_request.card_id).first()
+    card = get_card_answers(db, hint_request.card_id)
 
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
@@ -312,10 +464,16 @@ async def create_card(
         difficulty_level=card.difficulty_level,
     )
     db.add(db_card)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Card already exists")
     db.refresh(db_card)
+    invalidate_card_caches()
     logger.info(f"Created new card: {card.english} -> {card.vietnamese}")
-    return db_card
+    # Card rows already match CardResponse; returning a Response skips re-validation
+    return ORJSONResponse({col.key: getattr(db_card, col.key) for col in CARD_RESPONSE_COLUMNS})
 
 
 @app.get("/api/cards", response_model=list[CardResponse])
@@ -328,11 +486,13 @@ async def list_cards(
     _: None = Depends(require_auth),
 ):
     """List all cards in the deck, optionally filtered by category."""
-    query = db.query(Card)
+    await flush_pending_stats(db)
+    query = select(*CARD_RESPONSE_COLUMNS)
     if category:
-        query = query.filter(Card.category == category)
-    cards = query.offset(skip).limit(limit).all()
-    return cards
+        query = query.where(Card.category == category)
+    rows = db.execute(query.offset(skip).limit(limit)).mappings().all()
+    # Rows already match CardResponse; returning a Response skips re-validation
+    return ORJSONResponse([dict(row) for row in rows])
 
 
 @app.get("/api/stats")
@@ -342,18 +502,28 @@ async def get_stats(
     _: None = Depends(require_auth),
 ):
     """Get overall learning statistics."""
-    total_cards = db.query(Card).count()
-    total_success = db.query(func.sum(Card.success_count)).scalar() or 0
-    total_fail = db.query(func.sum(Card.fail_count)).scalar() or 0
+    global _stats_cache
+    await flush_pending_stats(db)
+    if _stats_cache is not None:
+        return _stats_cache
+
+    total_cards, total_success, total_fail = db.execute(
+        select(
+            func.count(Card.id),
+            func.coalesce(func.sum(Card.success_count), 0),
+            func.coalesce(func.sum(Card.fail_count), 0),
+        )
+    ).one()
     total_attempts = total_success + total_fail
 
-    return {
+    _stats_cache = {
         "total_cards": total_cards,
         "total_attempts": total_attempts,
         "total_success": total_success,
         "total_fail": total_fail,
         "accuracy": round(total_success / total_attempts * 100, 1) if total_attempts > 0 else 0,
     }
+    return _stats_cache
 
 
 @app.post("/api/mastery/reset")
@@ -364,6 +534,7 @@ async def reset_mastery(
     _: None = Depends(require_auth),
 ):
     """Reset mastery status for cards in a category (or all cards if category is None)."""
+    await flush_pending_stats(db)
     query = db.query(Card)
     if reset_request.category:
         query = query.filter(Card.category == reset_request.category)
@@ -391,19 +562,33 @@ async def list_topics(
     _: None = Depends(require_auth),
 ):
     """List all available vocabulary topics from CSV files."""
-    topics = get_available_topics()
-    return [TopicInfo(name=t["name"], filename=t["filename"]) for t in topics]
+    topics, etag = get_topic_listing()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    # Topics already match TopicInfo; returning a Response skips re-validation
+    return ORJSONResponse(topics, headers={"ETag": etag})
 
 
 @app.get("/api/categories")
 async def list_categories(
     request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     _: None = Depends(require_auth),
 ):
     """List all categories currently in the database."""
-    categories = db.query(Card.category).distinct().filter(Card.category.isnot(None)).all()
-    return [c[0] for c in categories]
+    global _categories_cache
+    if _categories_cache is None or _categories_cache[0] <= time.monotonic():
+        categories = db.execute(
+            select(Card.category).where(Card.category.isnot(None)).distinct()
+        ).scalars().all()
+        _categories_cache = (time.monotonic() + CATEGORIES_TTL, categories, make_etag(categories))
+
+    _, categories, etag = _categories_cache
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return categories
 
 
 @app.post("/api/topics/load", response_model=TopicLoadResponse)
@@ -414,8 +599,19 @@ async def load_topic(
     _: None = Depends(require_auth),
 ):
     """Load vocabulary from a CSV file into the database."""
+    # Clearing deletes every card, so wait out any in-flight stats write and
+    # keep new ones out until the results queued for the old cards are dropped
+    lock = stats_write_lock if topic_request.clear_existing else nullcontext()
     try:
-        count = load_topic_into_db(topic_request.filename, db, topic_request.clear_existing)
+        async with lock:
+            # Parsing and inserting block, so keep them off the event loop
+            count = await run_in_threadpool(
+                load_topic_into_db, topic_request.filename, db, topic_request.clear_existing
+            )
+            if topic_request.clear_existing:
+                # Only once the delete has committed: queued results now refer to gone cards
+                discard_pending_stats()
+        invalidate_card_caches()
         action = "Replaced all cards with" if topic_request.clear_existing else "Added"
         logger.info(f"Loaded {count} cards from {topic_request.filename}")
         return TopicLoadResponse(
@@ -438,7 +634,8 @@ async def sync_topics(
         VOCAB_DIR.mkdir(parents=True)
         return {"message": "Created vocab/ directory. Add CSV files and sync again.", "loaded": {}}
 
-    results = sync_all_topics(db)
+    results = await run_in_threadpool(sync_all_topics, db)
+    invalidate_card_caches()
     total = sum(results.values())
     logger.info(f"Synced {total} cards from {len(results)} files")
     return {
@@ -447,6 +644,21 @@ async def sync_topics(
     }
 
 
+@app.post("/api/admin/reload")
+async def reload_topics(
+    request: Request,
+    _: None = Depends(require_auth),
+):
+    """Re-read all CSV files from vocab/ into memory."""
+    index = await run_in_threadpool(reload_topic_index)
+    total = sum(len(cards) for _, cards in index.values())
+    logger.info(f"Reloaded {len(index)} topics ({total} rows)")
+    return {
+        "message": f"Reloaded {len(index)} topics ({total} rows)",
+        "topics": len(index),
+    }
+
+
 @app.delete("/api/cards")
 async def clear_all_cards(
     request: Request,
@@ -454,8 +666,11 @@ async def clear_all_cards(
     _: None = Depends(require_auth),
 ):
     """Delete all cards from the database."""
-    count = db.query(Card).count()
-    db.query(Card).delete()
-    db.commit()
+    async with stats_write_lock:
+        discard_pending_stats()
+        count = db.query(Card).count()
+        db.query(Card).delete()
+        db.commit()
+    invalidate_card_caches()
     logger.warning(f"Deleted all {count} cards")
     return {"message": f"Deleted {count} cards"}
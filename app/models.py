@@ -1,17 +1,39 @@
 from datetime import datetime
-from sqlalchemy import Integer, String, DateTime, Boolean
+from sqlalchemy import Integer, String, DateTime, Boolean, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
+from app.normalize import normalize_vietnamese
+
+
+def _normalized(column: str):
+    """Column default that stores the normalized form of another column.
+
+    Runs for ORM adds and Core inserts alike, executemany included.
+    """
+    def default(context) -> str:
+        return normalize_vietnamese(context.get_current_parameters()[column])
+    return default
 
 
 class Card(Base):
     __tablename__ = "cards"
+    __table_args__ = (
+        Index("ix_cards_category_id", "category", "id"),
+        Index("uq_cards_vietnamese_english", "vietnamese", "english", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     vietnamese: Mapped[str] = mapped_column(String, nullable=False)
     english: Mapped[str] = mapped_column(String, nullable=False)
-    category: Mapped[str | None] = mapped_column(String, nullable=True)
+    # Comparison keys for /api/check, precomputed from vietnamese/english
+    vietnamese_key: Mapped[str] = mapped_column(
+        String, nullable=False, default=_normalized("vietnamese")
+    )
+    english_key: Mapped[str] = mapped_column(
+        String, nullable=False, default=_normalized("english")
+    )
+    category: Mapped[str | None] = mapped_column(String, nullable=True, index=True)
     difficulty_level: Mapped[int] = mapped_column(Integer, default=1)
     success_count: Mapped[int] = mapped_column(Integer, default=0)
     fail_count: Mapped[int] = mapped_column(Integer, default=0)
@@ -0,0 +1,12 @@
+"""Answer normalization shared by the API and card storage."""
+
+import unicodedata
+
+
+def normalize_vietnamese(text: str) -> str:
+    """Normalize Vietnamese text for comparison."""
+    text = text.strip().lower()
+    # ASCII is always NFC; isascii() is a flag check on the string object
+    if text.isascii() or unicodedata.is_normalized("NFC", text):
+        return text
+    return unicodedata.normalize("NFC", text)
@@ -0,0 +1,149 @@
+"""Buffer per-card review results in memory and write them in batches."""
+
+import asyncio
+import logging
+from collections.abc import Callable
+from datetime import datetime
+
+from sqlalchemy import Boolean, bindparam, case, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Card
+
+logger = logging.getLogger(__name__)
+
+STATS_FLUSH_INTERVAL = 2  # seconds
+
+# card_id -> [success_delta, fail_delta, last_reviewed, mastered]
+# Only touched from the event loop thread, so swapping the dict is atomic.
+_pending_stats: dict[int, list] = {}
+
+# Held while a batch is written and while cards are deleted. Without it a batch
+# taken before a clear could commit after it and land on the new cards, since
+# SQLite reuses the freed ids.
+stats_write_lock = asyncio.Lock()
+
+# A single Core UPDATE per card: no ORM change tracking, no identity map
+_cards = Card.__table__
+_increment_stmt = (
+    update(_cards)
+    .where(_cards.c.id == bindparam("b_id"))
+    .values(
+        success_count=_cards.c.success_count + bindparam("b_success"),
+        fail_count=_cards.c.fail_count + bindparam("b_fail"),
+        last_reviewed=bindparam("b_reviewed"),
+        mastered=case(
+            (bindparam("b_mastered", type_=Boolean), True),
+            else_=_cards.c.mastered,
+        ),
+    )
+)
+
+
+def record_result(card_id: int, correct: bool, mastered: bool = False) -> None:
+    """Queue a success or failure for a card."""
+    entry = _pending_stats.get(card_id)
+    if entry is None:
+        entry = _pending_stats[card_id] = [0, 0, None, False]
+    if correct:
+        entry[0] += 1
+    else:
+        entry[1] += 1
+    entry[2] = datetime.utcnow()
+    entry[3] = entry[3] or mastered
+
+
+def take_pending_stats() -> dict[int, list]:
+    """Detach and return everything queued so far."""
+    global _pending_stats
+    pending, _pending_stats = _pending_stats, {}
+    return pending
+
+
+def discard_pending_stats() -> None:
+    """Drop queued results, e.g. when the cards they refer to are deleted."""
+    take_pending_stats()
+
+
+def _requeue_stats(pending: dict[int, list]) -> None:
+    """Merge a batch that failed to write back into the queue."""
+    for card_id, (success, fail, reviewed, mastered) in pending.items():
+        entry = _pending_stats.get(card_id)
+        if entry is None:
+            _pending_stats[card_id] = [success, fail, reviewed, mastered]
+            continue
+        entry[0] += success
+        entry[1] += fail
+        entry[2] = max(entry[2], reviewed)
+        entry[3] = entry[3] or mastered
+
+
+def write_stats(db: Session, pending: dict[int, list]) -> None:
+    """Apply queued results in one batched UPDATE and commit."""
+    if not pending:
+        return
+    rows = [
+        {
+            "b_id": card_id,
+            "b_success": success,
+            "b_fail": fail,
+            "b_reviewed": reviewed,
+            "b_mastered": mastered,
+        }
+        for card_id, (success, fail, reviewed, mastered) in pending.items()
+    ]
+    db.connection().execute(_increment_stmt, rows)
+    db.commit()
+
+
+async def flush_pending_stats(db: Session) -> None:
+    """Write everything queued so far using the given session.
+
+    Waits for a batch the background task is writing, so reads that follow
+    see it too.
+    """
+    async with stats_write_lock:
+        pending = take_pending_stats()
+        try:
+            write_stats(db, pending)
+        except Exception:
+            db.rollback()
+            _requeue_stats(pending)
+            raise
+
+
+def _write_stats_in_new_session(pending: dict[int, list]) -> None:
+    db = SessionLocal()
+    try:
+        write_stats(db, pending)
+    finally:
+        db.close()
+
+
+async def flush_stats_forever(on_flush: Callable[[], None] | None = None) -> None:
+    """Periodically write queued results (run as a background task).
+
+    on_flush is called on the event loop after each batch has committed, so
+    anything derived from the stats read while the write was in flight can be
+    dropped.
+    """
+    try:
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            async with stats_write_lock:
+                pending = take_pending_stats()
+                if not pending:
+                    continue
+                try:
+                    await asyncio.to_thread(_write_stats_in_new_session, pending)
+                except Exception:
+                    logger.exception(f"Failed to flush stats for {len(pending)} cards, requeued them")
+                    _requeue_stats(pending)
+                    continue
+            if on_flush is not None:
+                on_flush()
+    finally:
+        pending = take_pending_stats()
+        if pending:
+            _write_stats_in_new_session(pending)
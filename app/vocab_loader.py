@@ -1,33 +1,73 @@
 """Load vocabulary from CSV files in the vocab/ directory."""
 
 import csv
+import hashlib
+import logging
+import os
 from pathlib import Path
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
 from app.models import Card
 
+logger = logging.getLogger(__name__)
+
 VOCAB_DIR = Path(__file__).parent.parent / "vocab"
 
+# Filename word separators, turned into spaces for display names and categories
+_SEPARATORS = str.maketrans({"_": " ", "-": " "})
 
-def get_available_topics() -> list[dict]:
-    """List all available vocabulary topics from CSV files.
 
-    Returns list of dicts with 'name' (display name) and 'filename'.
+# ((vocab/ path, mtime), topics, etag). Adding, removing or renaming a CSV
+# updates the directory mtime, so one stat is enough to tell whether the
+# listing changed.
+_topics_cache: tuple[tuple[Path, int | None], list[dict], str] | None = None
+
+
+def vocab_dir_mtime() -> int | None:
+    """Return the vocab/ directory mtime, or None if it does not exist."""
+    try:
+        return VOCAB_DIR.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_topic_listing() -> tuple[list[dict], str]:
+    """List all available vocabulary topics along with an ETag for the list.
+
+    Topics are dicts with 'name' (display name) and 'filename'. The list is
+    cached until vocab/ changes; callers must not mutate it.
     """
-    if not VOCAB_DIR.exists():
-        return []
+    global _topics_cache
+    key = (VOCAB_DIR, vocab_dir_mtime())
+    if _topics_cache is not None and _topics_cache[0] == key:
+        return _topics_cache[1], _topics_cache[2]
+
+    filenames = []
+    if key[1] is not None:
+        with os.scandir(VOCAB_DIR) as entries:
+            filenames = [entry.name for entry in entries if entry.name.endswith(".csv")]
+        filenames.sort()
 
     topics = []
-    for csv_file in sorted(VOCAB_DIR.glob("*.csv")):
+    for filename in filenames:
         # Convert filename to display name: "common_words.csv" -> "Common Words"
-        display_name = csv_file.stem.replace("_", " ").replace("-", " ").title()
-        topics.append({
-            "name": display_name,
-            "filename": csv_file.name,
-            "path": str(csv_file),
-        })
+        display_name = filename[:-4].translate(_SEPARATORS).title()
+        topics.append({"name": display_name, "filename": filename})
+
+    # Display names derive from filenames, so the filenames identify the listing
+    digest = hashlib.blake2b("\n".join(filenames).encode(), digest_size=8).hexdigest()
+    _topics_cache = (key, topics, f'"{digest}"')
+    return topics, _topics_cache[2]
+
+
+def get_available_topics() -> list[dict]:
+    """List all available vocabulary topics from CSV files.
 
-    return topics
+    Returns list of dicts with 'name' (display name) and 'filename'.
+    The list is cached until vocab/ changes; callers must not mutate it.
+    """
+    return get_topic_listing()[0]
 
 
 def load_csv_file(filepath: Path) -> list[dict]:
@@ -42,17 +82,34 @@ def load_csv_file(filepath: Path) -> list[dict]:
     """
     cards = []
 
-    with open(filepath, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-
-        # Normalize column names (lowercase, strip whitespace)
-        if reader.fieldnames:
-            reader.fieldnames = [name.lower().strip() for name in reader.fieldnames]
+    with open(filepath, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+
+        # Normalize column names (lowercase, strip whitespace) and map each to
+        # its first position in one pass, so rows are indexed instead of
+        # mapped to dicts
+        col_idx: dict[str, int] = {}
+        for i, name in enumerate(next(reader, ())):
+            col_idx.setdefault(name.strip().lower(), i)
+        if "vietnamese" not in col_idx or "english" not in col_idx:
+            return cards
+
+        i_viet = col_idx["vietnamese"]
+        i_eng = col_idx["english"]
+        # Optional columns: when absent, every row gets the same constant
+        i_cat = col_idx.get("category", -1)
+        i_diff = col_idx.get("difficulty_level", -1)
+        has_cat = i_cat >= 0
+        has_diff = i_diff >= 0
+        width = max(i_viet, i_eng, i_cat, i_diff) + 1
 
         for row in reader:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+
             # Skip empty rows
-            vietnamese = row.get("vietnamese", "").strip()
-            english = row.get("english", "").strip()
+            vietnamese = row[i_viet].strip()
+            english = row[i_eng].strip()
 
             if not vietnamese or not english:
                 continue
@@ -60,13 +117,65 @@ def load_csv_file(filepath: Path) -> list[dict]:
             cards.append({
                 "vietnamese": vietnamese,
                 "english": english,
-                "category": row.get("category", "").strip() or None,
-                "difficulty_level": int(row.get("difficulty_level", 1) or 1),
+                "category": (row[i_cat].strip() or None) if has_cat else None,
+                "difficulty_level": int(row[i_diff] or 1) if has_diff else 1,
             })
 
     return cards
 
 
+# (mtime, parsed rows) of every CSV in vocab/, keyed by filename. Filled at
+# startup and by reload_topic_index(); files that are missing or have changed
+# since are parsed again on demand.
+TOPIC_INDEX: dict[str, tuple[int, list[dict]]] = {}
+
+
+def _parse_topic(filepath: Path) -> tuple[int, list[dict]]:
+    # Stat before reading, so an edit made mid-read is picked up next time
+    mtime = filepath.stat().st_mtime_ns
+    return mtime, load_csv_file(filepath)
+
+
+def reload_topic_index() -> dict[str, tuple[int, list[dict]]]:
+    """Rescan vocab/ and parse every CSV into TOPIC_INDEX."""
+    global _topics_cache
+    _topics_cache = None
+    index = {}
+    for topic in get_available_topics():
+        # One malformed file must not take the others (or startup) down with it;
+        # it is left out of the index and fails on its own when loaded.
+        try:
+            index[topic["filename"]] = _parse_topic(VOCAB_DIR / topic["filename"])
+        except (OSError, UnicodeDecodeError, ValueError, csv.Error):
+            logger.exception(f"Failed to parse {topic['filename']}, leaving it out of the index")
+    TOPIC_INDEX.clear()
+    TOPIC_INDEX.update(index)
+    return TOPIC_INDEX
+
+
+def get_topic_cards(filename: str) -> list[dict]:
+    """Return the parsed rows of a topic CSV, re-parsing it if it changed on disk."""
+    filepath = VOCAB_DIR / filename
+    cached = TOPIC_INDEX.get(filename)
+    if cached is not None and cached[0] == filepath.stat().st_mtime_ns:
+        return cached[1]
+    TOPIC_INDEX[filename] = entry = _parse_topic(filepath)
+    return entry[1]
+
+
+def insert_new_cards(db: Session, rows: list[dict]) -> int:
+    """Insert card rows, letting the database skip existing (vietnamese, english) pairs.
+
+    Returns the number of rows actually inserted.
+    """
+    if not rows:
+        return 0
+
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Card.__table__).on_conflict_do_nothing()
+    return db.execute(stmt, rows).rowcount
+
+
 def load_topic_into_db(filename: str, db: Session, clear_existing: bool = False) -> int:
     """Load a vocabulary CSV file into the database.
 
@@ -83,35 +192,24 @@ def load_topic_into_db(filename: str, db: Session, clear_existing: bool = False)
     if not filepath.exists():
         raise FileNotFoundError(f"Vocabulary file not found: {filename}")
 
+    # The delete and the inserts below commit together as one transaction
     if clear_existing:
         db.query(Card).delete()
-        db.commit()
 
     # Use filename (without extension) as category if not specified in CSV
-    default_category = filepath.stem.replace("_", " ").replace("-", " ")
-
-    cards_data = load_csv_file(filepath)
-    count = 0
-
-    for data in cards_data:
-        # Check if card already exists (same vietnamese + english)
-        existing = db.query(Card).filter(
-            Card.vietnamese == data["vietnamese"],
-            Card.english == data["english"],
-        ).first()
-
-        if existing:
-            continue
-
-        card = Card(
-            vietnamese=data["vietnamese"],
-            english=data["english"],
-            category=data["category"] or default_category,
-            difficulty_level=data["difficulty_level"],
-        )
-        db.add(card)
-        count += 1
-
+    default_category = filepath.stem.translate(_SEPARATORS)
+
+    rows = [
+        {
+            "vietnamese": data["vietnamese"],
+            "english": data["english"],
+            "category": data["category"] or default_category,
+            "difficulty_level": data["difficulty_level"],
+        }
+        for data in get_topic_cards(filename)
+    ]
+
+    count = insert_new_cards(db, rows)
     db.commit()
     return count
 
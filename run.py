@@ -5,6 +5,7 @@ Double-click this file or run it to start the app.
 Press Ctrl+C in the terminal or close the window to stop.
 """
 
+import socket
 import subprocess
 import sys
 import time
@@ -12,6 +13,27 @@ import webbrowser
 from pathlib import Path
 
 
+HOST = "127.0.0.1"
+PORT = 8000
+
+
+def wait_for_server(process, timeout=10.0):
+    """Poll the port until the server accepts connections.
+
+    Returns False if the server exits or does not come up within timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection((HOST, PORT), timeout=0.1):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
 def main():
     # Get the project directory
     project_dir = Path(__file__).parent
@@ -30,19 +52,20 @@ def main():
             [
                 sys.executable, "-m", "uvicorn",
                 "app.main:app",
-                "--host", "127.0.0.1",
-                "--port", "8000",
+                "--host", HOST,
+                "--port", str(PORT),
+                "--no-access-log",
             ],
             cwd=project_dir,
         )
 
-        # Wait a moment for server to start
-        time.sleep(2)
-
-        # Open browser
-        url = "http://127.0.0.1:8000"
-        print(f"Opening browser at {url}")
-        webbrowser.open(url)
+        # Open the browser as soon as the server is accepting connections
+        url = f"http://{HOST}:{PORT}"
+        if wait_for_server(process):
+            print(f"Opening browser at {url}")
+            webbrowser.open(url)
+        elif process.poll() is None:
+            print(f"Server is slow to start; open {url} once it is ready")
 
         # Wait for process to end (Ctrl+C)
         process.wait()
@@ -1,6 +1,6 @@
 """Seed the database with initial Vietnamese vocabulary."""
 
-from app.database import SessionLocal, engine, Base
+from app.database import SessionLocal, init_db
 from app.models import Card
 
 # Common Vietnamese words for beginners
@@ -67,7 +67,7 @@ SEED_DATA = [
 
 def seed_database():
     """Seed the database with initial vocabulary."""
-    Base.metadata.create_all(bind=engine)
+    init_db()
 
     db = SessionLocal()
     try:
@@ -76,15 +76,8 @@ def seed_database():
             print(f"Database already has {existing_count} cards. Skipping seed.")
             return
 
-        for item in SEED_DATA:
-            card = Card(
-                vietnamese=item["vietnamese"],
-                english=item["english"],
-                category=item.get("category"),
-                difficulty_level=1,
-            )
-            db.add(card)
-
+        rows = [{**item, "difficulty_level": 1} for item in SEED_DATA]
+        db.execute(Card.__table__.insert(), rows)
         db.commit()
         print(f"Successfully seeded {len(SEED_DATA)} cards!")
 
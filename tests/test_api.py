@@ -1,58 +1,100 @@
 """Tests for the MyCon Learn API."""
 
+import asyncio
+import os
+import threading
+import time
+import unicodedata
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import QueuePool
 
-from app.database import Base, get_db
+from app import auth, stats_buffer, vocab_loader
+from app.database import Base, get_db, run_migrations
+from app import main
 from app.main import app
 from app.models import Card
 
-# Use in-memory SQLite for testing
-TEST_DATABASE_URL = "sqlite:///:memory:"
+# Use a shared-cache in-memory SQLite database, so every pooled connection
+# sees the same tables
+TEST_DATABASE_URL = "sqlite:///file:memdb1?mode=memory&cache=shared&uri=true"
 engine = create_engine(
     TEST_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
+    poolclass=QueuePool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Let SQLAlchemy manage transactions itself so SAVEPOINTs work with pysqlite
+@event.listens_for(engine, "connect")
+def disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
 
 
-app.dependency_overrides[get_db] = override_get_db
+@event.listens_for(engine, "begin")
+def begin_transaction(conn):
+    conn.exec_driver_sql("BEGIN")
 
 
-@pytest.fixture(autouse=True)
+# Nothing here needs durability, so skip journaling and fsyncs entirely
+@event.listens_for(engine, "connect")
+def set_test_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+@pytest.fixture(scope="session", autouse=True)
 def setup_database():
-    """Create tables before each test and drop after."""
+    """Create tables once for the whole test session."""
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
 
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def db_session():
+    """Run each test in a transaction that is rolled back afterwards.
+
+    Commits made by the app or fixtures only release a SAVEPOINT.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+
+    def override_get_db():
+        yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    # Tables are reset behind the API's back, so drop its derived caches too
+    main.invalidate_card_caches()
+    main.discard_pending_stats()
+    yield session
+
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture(scope="session")
 def client():
     return TestClient(app)
 
 
 @pytest.fixture
-def sample_card():
+def sample_card(db_session):
     """Create a sample card in the database."""
-    db = TestingSessionLocal()
     card = Card(vietnamese="xin chào", english="hello", category="greetings")
-    db.add(card)
-    db.commit()
-    db.refresh(card)
-    db.close()
+    db_session.add(card)
+    db_session.commit()
+    db_session.refresh(card)
     return card
 
 
@@ -68,6 +110,13 @@ class TestCardAPI:
         assert data["english"] == "thank you"
         assert data["id"] is not None
 
+    def test_create_duplicate_card_conflicts(self, client, sample_card):
+        response = client.post(
+            "/api/card",
+            json={"vietnamese": "xin chào", "english": "hello", "category": "other"},
+        )
+        assert response.status_code == 409
+
     def test_get_random_card(self, client, sample_card):
         response = client.get("/api/card/random?mode=eng_to_viet")
         assert response.status_code == 200
@@ -82,6 +131,34 @@ class TestCardAPI:
         assert data["prompt"] == "xin chào"
         assert data["mode"] == "viet_to_eng"
 
+    def test_get_random_card_by_category(self, client, sample_card):
+        client.post(
+            "/api/card",
+            json={"vietnamese": "một", "english": "one", "category": "numbers"},
+        )
+        for _ in range(10):
+            response = client.get("/api/card/random?category=numbers")
+            assert response.status_code == 200
+            assert response.json()["prompt"] == "one"
+
+    def test_random_card_is_uniform_across_id_gaps(self, db_session):
+        # Other categories' ids sit between the last two greetings
+        cards = [Card(vietnamese=f"chào {i}", english=f"greet{i}", category="greet") for i in range(10)]
+        cards += [Card(vietnamese=f"số {i}", english=f"other{i}", category="other") for i in range(200)]
+        cards.append(Card(vietnamese="chào 10", english="greet10", category="greet"))
+        db_session.add_all(cards)
+        db_session.commit()
+
+        draws = 2200
+        counts = {}
+        for _ in range(draws):
+            card = main.sample_card(db_session, "greet")
+            counts[card.english] = counts.get(card.english, 0) + 1
+
+        assert len(counts) == 11
+        # Each card expects 200 draws; the bounds are about 6 standard deviations out
+        assert all(120 < n < 280 for n in counts.values()), counts
+
     def test_no_cards_returns_404(self, client):
         response = client.get("/api/card/random")
         assert response.status_code == 404
@@ -153,6 +230,26 @@ class TestCheckAnswer:
         assert data["correct"] is True
 
 
+    def test_results_visible_after_flush(self, client, sample_card):
+        """Buffered results are written before cards are listed."""
+        client.post(
+            "/api/check",
+            json={"card_id": sample_card.id, "user_input": "hello", "mark_mastered": True},
+        )
+        data = client.get("/api/cards").json()
+        assert data[0]["success_count"] == 1
+        assert data[0]["mastered"] is True
+        assert data[0]["last_reviewed"] is not None
+
+    def test_decomposed_card_text_matches(self, client):
+        """Stored keys are NFC, so decomposed card text still matches."""
+        decomposed = unicodedata.normalize("NFD", "Cảm ơn ")
+        card = client.post("/api/card", json={"vietnamese": decomposed, "english": "Thanks"}).json()
+        for answer in ("cảm ơn", "thanks"):
+            response = client.post("/api/check", json={"card_id": card["id"], "user_input": answer})
+            assert response.json()["correct"] is True
+
+
 class TestHints:
     def test_hint_level_1(self, client, sample_card):
         response = client.post(
@@ -237,3 +334,243 @@ class TestStats:
         response = client.get("/api/stats")
         data = response.json()
         assert data["total_fail"] == 1
+
+    def test_failed_write_requeues_results(self, db_session, monkeypatch):
+        stats_buffer.record_result(1, True, mastered=True)
+        newer = {}
+
+        def locked_write(db, pending):
+            # A result recorded while the batch is in flight
+            stats_buffer.record_result(1, False)
+            newer["reviewed"] = stats_buffer._pending_stats[1][2]
+            raise OperationalError("UPDATE cards", {}, Exception("database is locked"))
+
+        monkeypatch.setattr(stats_buffer, "write_stats", locked_write)
+        with pytest.raises(OperationalError):
+            asyncio.run(stats_buffer.flush_pending_stats(db_session))
+        assert stats_buffer._pending_stats == {1: [1, 1, newer["reviewed"], True]}
+
+    def test_lifespan_flusher_drops_stats_cache(self, client, monkeypatch):
+        """A batch committing after /api/stats was cached invalidates it."""
+        started, release = threading.Event(), threading.Event()
+
+        def slow_write(pending):
+            started.set()
+            release.wait(timeout=1)
+
+        monkeypatch.setattr(main, "init_db", lambda: None)
+        monkeypatch.setattr(stats_buffer, "STATS_FLUSH_INTERVAL", 0.01)
+        monkeypatch.setattr(stats_buffer, "_write_stats_in_new_session", slow_write)
+
+        with TestClient(app) as lifespan_client:
+            lifespan_client.get("/api/categories")
+            stats_buffer.record_result(1, True)
+            assert started.wait(timeout=1)
+            # A stats read while the batch is in flight caches pre-commit totals
+            main._stats_cache = {"total_attempts": 0}
+            release.set()
+            deadline = time.monotonic() + 1
+            while main._stats_cache is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert main._stats_cache is None
+        # Categories do not depend on review results, so that cache is kept
+        assert main._categories_cache is not None
+
+
+class TestTopics:
+    def test_list_topics(self, client):
+        response = client.get("/api/topics")
+        assert response.status_code == 200
+        assert {"name": "Greetings", "filename": "greetings.csv"} in response.json()
+
+    def test_list_topics_not_modified(self, client):
+        etag = client.get("/api/topics").headers["etag"]
+        response = client.get("/api/topics", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_list_topics_weak_and_wildcard_validators(self, client):
+        etag = client.get("/api/topics").headers["etag"]
+        for if_none_match in (f"W/{etag}", f'"other", W/{etag}', "*"):
+            response = client.get("/api/topics", headers={"If-None-Match": if_none_match})
+            assert response.status_code == 304, if_none_match
+        assert client.get("/api/topics", headers={"If-None-Match": 'W/"other"'}).status_code == 200
+
+    def test_categories_etag_changes_with_cards(self, client, sample_card):
+        response = client.get("/api/categories")
+        assert response.json() == ["greetings"]
+        etag = response.headers["etag"]
+        assert client.get("/api/categories", headers={"If-None-Match": etag}).status_code == 304
+
+        client.post("/api/card", json={"vietnamese": "một", "english": "one", "category": "numbers"})
+        response = client.get("/api/categories", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert sorted(response.json()) == ["greetings", "numbers"]
+
+    def test_load_topic_skips_duplicates(self, client, sample_card):
+        response = client.post("/api/topics/load", json={"filename": "greetings.csv"})
+        assert response.status_code == 200
+        loaded = response.json()["cards_loaded"]
+        assert loaded > 0
+
+        # "xin chào" / "hello" was already in the deck
+        total = client.get("/api/stats").json()["total_cards"]
+        assert total == loaded + 1
+
+        response = client.post("/api/topics/load", json={"filename": "greetings.csv"})
+        assert response.json()["cards_loaded"] == 0
+
+    def test_load_topic_clear_existing(self, client, sample_card):
+        response = client.post(
+            "/api/topics/load", json={"filename": "numbers.csv", "clear_existing": True}
+        )
+        assert response.status_code == 200
+        categories = client.get("/api/categories").json()
+        assert categories == ["numbers"]
+
+    def test_reload_topics(self, client, monkeypatch):
+        monkeypatch.setattr(vocab_loader, "TOPIC_INDEX", {})
+        response = client.post("/api/admin/reload")
+        assert response.status_code == 200
+        assert response.json()["topics"] == len(list(vocab_loader.VOCAB_DIR.glob("*.csv")))
+        assert vocab_loader.TOPIC_INDEX["greetings.csv"][1][0]["vietnamese"] == "xin chào"
+
+    def test_reload_skips_malformed_files(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(vocab_loader, "VOCAB_DIR", tmp_path)
+        monkeypatch.setattr(vocab_loader, "TOPIC_INDEX", {})
+        (tmp_path / "bad_level.csv").write_text(
+            "vietnamese,english,difficulty_level\nmèo,cat,easy\n", encoding="utf-8"
+        )
+        (tmp_path / "bad_encoding.csv").write_bytes("vietnamese,english\nmèo,cat\n".encode("cp1258"))
+        (tmp_path / "good.csv").write_text("vietnamese,english\nchó,dog\n", encoding="utf-8")
+
+        response = client.post("/api/admin/reload")
+        assert response.status_code == 200
+        assert response.json()["topics"] == 1
+        assert list(vocab_loader.TOPIC_INDEX) == ["good.csv"]
+
+    def test_load_topic_sees_edited_file(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(vocab_loader, "VOCAB_DIR", tmp_path)
+        monkeypatch.setattr(vocab_loader, "TOPIC_INDEX", {})
+        path = tmp_path / "animals.csv"
+        path.write_text("vietnamese,english\nmèo,cat\n", encoding="utf-8")
+        vocab_loader.reload_topic_index()
+        assert client.post("/api/topics/load", json={"filename": "animals.csv"}).json()["cards_loaded"] == 1
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("chó,dog\n")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+        assert client.post("/api/topics/load", json={"filename": "animals.csv"}).json()["cards_loaded"] == 1
+
+    def test_load_missing_topic_returns_404(self, client):
+        response = client.post("/api/topics/load", json={"filename": "nope.csv"})
+        assert response.status_code == 404
+
+    def test_failed_clear_keeps_queued_results(self, client, sample_card):
+        client.post("/api/check", json={"card_id": sample_card.id, "user_input": "hello"})
+        response = client.post(
+            "/api/topics/load", json={"filename": "nonexistent.csv", "clear_existing": True}
+        )
+        assert response.status_code == 404
+        assert client.get("/api/stats").json()["total_success"] == 1
+
+    def test_list_topics_sees_new_files(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(main, "VOCAB_DIR", tmp_path)
+        monkeypatch.setattr(vocab_loader, "VOCAB_DIR", tmp_path)
+        assert client.get("/api/topics").json() == []
+
+        (tmp_path / "new_words.csv").write_text("vietnamese,english\nmèo,cat\n", encoding="utf-8")
+        os.utime(tmp_path, ns=(0, tmp_path.stat().st_mtime_ns + 1))
+        assert client.get("/api/topics").json() == [
+            {"name": "New Words", "filename": "new_words.csv"}
+        ]
+
+
+class TestCsvLoading:
+    def test_columns_resolved_by_header(self, tmp_path):
+        path = tmp_path / "words.csv"
+        path.write_text(
+            "English , Vietnamese,Difficulty_Level,category\n"
+            "hi,chào,2,\n"
+            "\n"
+            ",missing\n"
+            "bye,tạm biệt,, farewell \n",
+            encoding="utf-8",
+        )
+        assert vocab_loader.load_csv_file(path) == [
+            {"vietnamese": "chào", "english": "hi", "category": None, "difficulty_level": 2},
+            {"vietnamese": "tạm biệt", "english": "bye", "category": "farewell", "difficulty_level": 1},
+        ]
+
+    def test_missing_required_column(self, tmp_path):
+        path = tmp_path / "words.csv"
+        path.write_text("vietnamese\nchào\n", encoding="utf-8")
+        assert vocab_loader.load_csv_file(path) == []
+
+
+class TestMigrations:
+    def test_legacy_cards_migrated(self, tmp_path):
+        legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with legacy.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE cards (id INTEGER PRIMARY KEY, vietnamese VARCHAR NOT NULL, "
+                "english VARCHAR NOT NULL, category VARCHAR, difficulty_level INT, "
+                "success_count INT DEFAULT 0, fail_count INT DEFAULT 0, "
+                "last_reviewed DATETIME, mastered BOOLEAN DEFAULT 0)"
+            ))
+            conn.execute(text(
+                "INSERT INTO cards (id, vietnamese, english, success_count, fail_count, last_reviewed, mastered) "
+                "VALUES (1, 'xin chào', 'hello', 2, 0, '2024-01-01 00:00:00', 0), "
+                "(2, ' Cảm Ơn', 'Thanks ', 0, 1, NULL, 0), "
+                "(3, 'xin chào', 'hello', 1, 4, '2025-01-01 00:00:00', 1)"
+            ))
+
+        with legacy.begin() as conn:
+            run_migrations(conn)
+
+        with legacy.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT id, success_count, fail_count, last_reviewed, mastered FROM cards ORDER BY id"
+            )).all()
+            assert rows == [(1, 3, 4, "2025-01-01 00:00:00", 1), (2, 0, 1, None, 0)]
+            keys = conn.execute(text("SELECT vietnamese_key, english_key FROM cards ORDER BY id")).all()
+            assert keys == [("xin chào", "hello"), ("cảm ơn", "thanks")]
+            unique = [index for index in inspect(conn).get_indexes("cards") if index["unique"]]
+            assert [(index["name"], index["column_names"]) for index in unique] == [
+                ("uq_cards_vietnamese_english", ["vietnamese", "english"])
+            ]
+        legacy.dispose()
+
+
+class TestSessions:
+    def test_session_tokens_stored_hashed(self):
+        token = auth.generate_session_token()
+        auth.add_session(token)
+        try:
+            assert token not in auth.authenticated_sessions
+            assert len(next(iter(auth.authenticated_sessions))) == 16
+        finally:
+            auth.remove_session(token)
+        assert not auth.authenticated_sessions
+
+    def test_purge_expired_sessions(self):
+        live, stale = auth.generate_session_token(), auth.generate_session_token()
+        auth.add_session(live)
+        auth.add_session(stale)
+        auth.authenticated_sessions[auth._session_key(stale)] = time.time() - 1
+        auth.purge_expired_sessions()
+        assert list(auth.authenticated_sessions) == [auth._session_key(live)]
+        auth.remove_session(live)
+
+
+class TestDiff:
+    def test_identical_has_no_diff(self):
+        assert main.generate_diff("xin chào", "xin chào") is None
+
+    def test_wrong_diacritic(self):
+        assert main.generate_diff("xin chào", "xin chao") == "'a'->'à'"
+
+    def test_leading_insert_is_single_edit(self):
+        assert main.generate_diff("hello", "xhello") == "extra 'x'"
+        assert main.generate_diff("hello", "ello") == "missing 'h'"